@@ -0,0 +1,107 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+class Batcher(object):
+    """
+    Groups concurrent requests that arrive within a short window and scores them with a single predict call.
+    Each request blocks on its own future until the worker thread hands back its slice of the predictions.
+    """
+
+    def __init__(self, predict_fn, max_batch, delay_ms):
+        self.predict_fn = predict_fn
+        self.max_batch = max_batch
+        self.delay = delay_ms / 1000.0
+        self.queue = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def submit(self, features):
+        if self.max_batch <= 1:
+            return self.predict_fn(features)
+
+        self._ensure_worker()
+        future = Future()
+        self.queue.put((features, future))
+        return future.result()
+
+    def _ensure_worker(self):
+        # threads do not survive gunicorn forking its workers, so every process starts its own
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid != os.getpid():
+                self.queue = queue.Queue()
+                threading.Thread(target=self._run, name="batcher", daemon=True).start()
+                self.pid = os.getpid()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                self._score(batch)
+            except Exception as e:
+                # the thread must outlive any failure, otherwise every later request of this worker waits forever
+                logger.exception("Scoring a batch failed")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _score(self, batch):
+        if len(batch) > 1:
+            try:
+                rows = [features.shape[0] for features, _ in batch]
+                res = self.predict_fn(np.vstack([features for features, _ in batch]))
+                if len(res) != sum(rows):
+                    raise ValueError(f"Batched prediction returned {len(res)} rows for {sum(rows)} inputs")
+            except Exception:
+                # a single malformed request should not fail the whole batch, score them one by one instead
+                logger.exception("Batched prediction failed, falling back to per-request scoring")
+            else:
+                offset = 0
+                for (_, future), n_rows in zip(batch, rows):
+                    end = offset + n_rows
+                    future.set_result(res[offset:end])
+                    offset = end
+                return
+
+        for features, future in batch:
+            try:
+                future.set_result(self.predict_fn(features))
+            except Exception as e:
+                future.set_exception(e)
@@ -16,13 +16,19 @@
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 
-def template(message, payload, status_code=500):
-    return {"message": message, "payload": payload, "status_code": status_code}
-
-
 class ScoringFailure(Exception):
     status_code = 500
 
+    MODEL_NOT_LOADED = "Model could not be loaded"
+    MODEL_WRONG_FORMAT = "Supplied model is in wrong format"
+    MISSING_ENV = "Endpoint environment is not configured properly"
+    UNSUPPORTED_PAYLOAD = "Model supports JSON inputs only "
+    EMPTY_DATA = "Received empty data file"
+    DATA_NOT_SUPPORTED = "Model does not support supplied data schema"
+    CANNOT_READ_DATA = "Could not read input data"
+    COULD_NOT_RETURN_DATA = "Could not return data to invoke lambda"
+    REQUEST_NOT_SUPPORTED = "No handler for JSON content"
+
     def __init__(self, message, status_code=None, payload=None):
         Exception.__init__(self)
         self.message = message
@@ -31,42 +37,42 @@ class ScoringFailure(Exception):
         self.payload = payload
 
     def to_dict(self):
-        rv = dict(self.payload or ())
+        rv = {} if self.payload is None else self.payload.copy()
         rv["message"] = self.message
         return rv
 
     @classmethod
     def model_not_loaded(cls, payload=None):
-        return cls(**template("Model could not be loaded", payload))
+        return cls(cls.MODEL_NOT_LOADED, 500, payload)
 
     @classmethod
     def model_wrong_format(cls, payload=None):
-        return cls(**template("Supplied model is in wrong format", payload))
+        return cls(cls.MODEL_WRONG_FORMAT, 500, payload)
 
     @classmethod
     def missing_env(cls, payload=None):
-        return cls(**template("Endpoint environment is not configured properly", payload))
+        return cls(cls.MISSING_ENV, 500, payload)
 
     @classmethod
     def unsupported_payload(cls, payload=None):
-        return cls(**template("Model supports JSON inputs only ", payload, 415))
+        return cls(cls.UNSUPPORTED_PAYLOAD, 415, payload)
 
     @classmethod
     def empty_data(cls, payload=None):
-        return cls(**template("Received empty data file", payload, 400))
+        return cls(cls.EMPTY_DATA, 400, payload)
 
     @classmethod
     def data_not_supported(cls, payload=None):
-        return cls(**template("Model does not support supplied data schema", payload, 400))
+        return cls(cls.DATA_NOT_SUPPORTED, 400, payload)
 
     @classmethod
     def cannot_read_data(cls, payload=None):
-        return cls(**template("Could not read input data", payload))
+        return cls(cls.CANNOT_READ_DATA, 500, payload)
 
     @classmethod
     def could_not_return_data(cls, payload=None):
-        return cls(**template("Could not return data to invoke lambda", payload, 416))
+        return cls(cls.COULD_NOT_RETURN_DATA, 416, payload)
 
     @classmethod
     def request_not_supported(cls, payload=None):
-        return cls(**template("No handler for JSON content", payload, 400))
+        return cls(cls.REQUEST_NOT_SUPPORTED, 400, payload)
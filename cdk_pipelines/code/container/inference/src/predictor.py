@@ -24,34 +24,54 @@ import logging
 import sys
 
 # own libs
+from batcher import Batcher
 from scorer import ScoringService
 
 # Logger
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Load the model once at import time; with gunicorn --preload this happens in the master before workers fork
+ScoringService.load_model()
+ScoringService.warm_up()
+
+# Micro-batching: requests arriving within BATCH_DELAY_MS of each other are scored together, up to MAX_BATCH.
+# Set MAX_BATCH to 1 to score every request on its own.
+MAX_BATCH = int(os.environ.get("MAX_BATCH", 32))
+BATCH_DELAY_MS = float(os.environ.get("BATCH_DELAY_MS", 2))
+
+batcher = Batcher(ScoringService.predict_fn, MAX_BATCH, BATCH_DELAY_MS)
+
 # The flask app for serving predictions
 app = flask.Flask(__name__)
 
 
+# The model is loaded before the app serves anything, so health checks always get the same prebuilt response
+_PING_OK = flask.Response(response=b"\n", status=200, mimetype="application/json")
+
+
 @app.route("/ping", methods=["GET"])
 def ping():
-    ScoringService.load_model()
-    status = 200 if ScoringService.model else 404
-    logger.info("Model status for {}: {}.".format(os.getpid(), str(status)))
-    return flask.Response(response="\n", status=200, mimetype="application/json")
+    return _PING_OK
+
+
+# Decoder and encoder for every supported content type, responses use the same format as the request
+_HANDLERS = {
+    "application/json": (ScoringService.input_fn, ScoringService.output_fn),
+    "application/x-npy": (ScoringService.npy_input_fn, ScoringService.npy_output_fn),
+    "application/octet-stream": (ScoringService.raw_input_fn, ScoringService.raw_output_fn),
+}
 
 
 @app.route("/invocations", methods=["POST"])
 def transformation():
-    if flask.request.content_type == "application/json":
-        ScoringService.load_model()
-        features = ScoringService.input_fn(flask.request)
-        res = ScoringService.predict_fn(features)
-    else:
-        err_msg = f"Type [{flask.request.content_type}] not supported"
-        logger.error(err_msg)
-        raise ValueError(err_msg)
+    content_type = flask.request.mimetype
+    handler = _HANDLERS.get(content_type)
+    if handler is None:
+        flask.abort(415)
+
+    input_fn, output_fn = handler
+    res = batcher.submit(input_fn(flask.request))
 
     logger.info("Finished processing request")
-    return flask.jsonify(res.tolist()), 200
+    return flask.Response(response=output_fn(res), status=200, mimetype=content_type)
@@ -15,30 +15,124 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import copy
+import flask
+import io
 import joblib
 import numpy as np
+import orjson
 import logging
+import os
 
 
 logger = logging.getLogger(__name__)
 
 
+def _default(obj):
+    # orjson falls back here for arrays it cannot serialize natively (e.g. object dtype class labels)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError
+
+
 class ScoringService(object):
     model = None
+    # dtype the model is fed with, float32 halves the memory traffic of float64 and sklearn accepts it natively.
+    # set MODEL_INPUT_DTYPE=float64 for models that need double precision
+    input_dtype = np.dtype(os.environ.get("MODEL_INPUT_DTYPE", "float32"))
+    # joblib worker pools only pay off on large batches, smaller ones are scored in a single thread
+    parallel_min_rows = int(os.environ.get("PARALLEL_PREDICT_MIN_ROWS", 2000))
+    parallel_model = None
 
     @classmethod
     def load_model(cls):
-        if not cls.model:
-            cls.model = joblib.load("/opt/ml/model/model.joblib")
+        if cls.model is None:
+            # memory-map the numpy arrays read-only so forked gunicorn workers share the pages instead of copying them.
+            # only effective for uncompressed joblib dumps, compressed ones are loaded into memory as before
+            cls.model = joblib.load("/opt/ml/model/model.joblib", mmap_mode="r")
+            if hasattr(cls.model, "n_jobs"):
+                # shallow copy shares the fitted estimators, only n_jobs differs
+                cls.parallel_model = copy.copy(cls.model)
+                cls.parallel_model.n_jobs = -1
+                cls.model.n_jobs = 1
+
+    @classmethod
+    def warm_up(cls):
+        # resolve the BLAS symbols and run one dummy prediction so the first real request does not pay for it
+        np.linalg.norm(np.ones((2, 2), dtype=cls.input_dtype) @ np.ones((2, 2), dtype=cls.input_dtype))
+        try:
+            cls.predict_fn(np.zeros((1, cls.model.n_features_in_), dtype=cls.input_dtype))
+        except Exception:
+            logger.warning("Could not warm up the model with a dummy prediction", exc_info=True)
 
     @classmethod
     def predict_fn(cls, inp):
-        out = cls.model.predict(inp)
+        model = cls.model
+        if cls.parallel_model is not None and inp.shape[0] > cls.parallel_min_rows:
+            model = cls.parallel_model
+        out = model.predict(inp.astype(cls.input_dtype, copy=False))
         return out
 
     @classmethod
     def input_fn(cls, request):
-        features = np.array(request.get_json()["features"])
+        try:
+            features = np.asarray(orjson.loads(request.get_data())["features"], dtype=cls.input_dtype)
+        except (KeyError, TypeError, ValueError):
+            # malformed JSON (orjson.JSONDecodeError is a ValueError), no "features" key or non numeric features
+            flask.abort(400)
+        if features.ndim == 1:
+            features = features.reshape(1, -1)
+        if features.ndim != 2:
+            flask.abort(400)
+        return features
+
+    @classmethod
+    def npy_input_fn(cls, request):
+        try:
+            features = np.load(io.BytesIO(request.get_data()), allow_pickle=False)
+        except (ValueError, OSError, EOFError):
+            # not a .npy payload, truncated, or an object array that would need unpickling
+            flask.abort(400)
+        if not isinstance(features, np.ndarray):
+            # .npz archives load as a mapping of arrays
+            flask.abort(400)
         if features.ndim == 1:
             features = features.reshape(1, -1)
+        if features.ndim != 2:
+            flask.abort(400)
         return features
+
+    @classmethod
+    def raw_input_fn(cls, request):
+        # raw little-endian float32 rows, viewed in place over the request body.
+        # the row width is the model's number of features, models that do not expose it need the X-Feature-Dim header
+        model_features = getattr(cls.model, "n_features_in_", None)
+        try:
+            n_features = int(request.headers.get("X-Feature-Dim", model_features))
+        except (TypeError, ValueError):
+            # header is not an integer, or it is missing and the model does not expose its number of features
+            flask.abort(400)
+        if n_features <= 0 or model_features not in (None, n_features):
+            flask.abort(400)
+        data = request.get_data()
+        # the body must hold a whole number of float32 rows
+        if not data or len(data) % (n_features * np.dtype(np.float32).itemsize):
+            flask.abort(400)
+        return np.frombuffer(data, dtype=np.float32).reshape(-1, n_features)
+
+    @classmethod
+    def output_fn(cls, prediction):
+        return orjson.dumps(prediction, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+    @classmethod
+    def npy_output_fn(cls, prediction):
+        buffer = io.BytesIO()
+        np.save(buffer, prediction, allow_pickle=False)
+        return buffer.getvalue()
+
+    @classmethod
+    def raw_output_fn(cls, prediction):
+        # raw responses are float32 only, models predicting e.g. string class labels need the JSON or npy formats
+        if prediction.dtype.kind not in "biuf":
+            flask.abort(406)
+        return prediction.astype(np.float32, copy=False).tobytes()
@@ -16,18 +16,55 @@
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 from aws_lambda_powertools import Logger
+import functools
 import os
+import time
 import boto3
-import json
+from botocore.config import Config
 
 """Initialise Logger class"""
 logger = Logger(service="inference_api")
 
 """Environment Variables"""
 ENDPOINT_NAME = os.getenv("ENDPOINT_NAME")
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", 300))  # 0 or less disables the response cache
 
-"""Boto3 clients"""
-sm = boto3.client("sagemaker-runtime")
+"""Boto3 clients, created once per execution environment so the connection pool is reused across warm invokes"""
+sm = boto3.client(
+    "sagemaker-runtime",
+    config=Config(
+        max_pool_connections=50,
+        retries={"max_attempts": 2, "mode": "standard"},
+        tcp_keepalive=True,
+    ),
+)
+
+
+@functools.lru_cache(maxsize=1024)
+def invoke_endpoint(body, ttl_bucket=None):
+    """
+    Invokes the Endpoint and returns the raw response body. Responses are cached per request body and TTL window,
+    so repeated inputs skip the SageMaker round trip while a newly deployed model is picked up after the TTL
+    @param body: request body forwarded to the Endpoint
+    @param ttl_bucket: index of the current TTL window, only part of the cache key
+    @return: raw bytes of the Endpoint response
+    """
+    res = sm.invoke_endpoint(
+        EndpointName=ENDPOINT_NAME,
+        Body=body,
+        ContentType="application/json",
+    )
+    return res["Body"].read()
+
+
+def cache_disabled(event):
+    """
+    Checks whether the caller asked to bypass the response cache with a Cache-Control: no-cache header
+    @param event: API Gateway proxy event
+    @return: True if the cached response must not be used
+    """
+    headers = event.get("headers") or {}
+    return any(k.lower() == "cache-control" and v == "no-cache" for k, v in headers.items())
 
 
 @logger.inject_lambda_context(log_event=True)
@@ -42,15 +79,15 @@ def handler(event, context):
     resource = event["resource"]
 
     if resource == "/inference":
-        res = sm.invoke_endpoint(
-            EndpointName=ENDPOINT_NAME,
-            Body=event["body"],
-            ContentType="application/json",
-        )
+        if CACHE_TTL_SECONDS <= 0 or cache_disabled(event):
+            res = invoke_endpoint.__wrapped__(event["body"])
+        else:
+            res = invoke_endpoint(event["body"], int(time.time() // CACHE_TTL_SECONDS))
         return {
             "statusCode": 200,
             "headers": {"x-custom-header": "Inference API Response"},
-            "body": json.loads(res["Body"].read()),
+            "body": res.decode("utf-8"),  # the Endpoint already returns JSON, pass it through as is
+            "isBase64Encoded": False,
         }
 
     # Unknown resource, 404 not found response
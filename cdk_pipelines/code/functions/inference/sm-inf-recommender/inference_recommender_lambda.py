@@ -15,14 +15,22 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import io
 import json
 import os
 import tarfile
+import time
 import boto3
-from datetime import datetime, timezone
+from botocore.config import Config
 
-s3_client = boto3.client("s3")
-sm_client = boto3.client("sagemaker")
+boto_config = Config(
+    max_pool_connections=50,
+    retries={"max_attempts": 2, "mode": "standard"},
+    tcp_keepalive=True,
+)
+
+s3_client = boto3.client("s3", config=boto_config)
+sm_client = boto3.client("sagemaker", config=boto_config)
 
 MODEL_BUCKET = os.environ["MODEL_BUCKET"]
 MODEL_URL = os.environ["MODEL_URL"]
@@ -32,19 +40,20 @@ INFERENCE_RECOMMENDER_ROLE_ARN = os.environ["INFERENCE_RECOMMENDER_ROLE_ARN"]
 
 
 def handler(event, context):
-    # upload the payload to the s3 bucket
-    payload_file = "/tmp/payload.json"
-
-    with open(payload_file, "w") as f:
-        json.dump(event, f)
+    # upload the payload to the s3 bucket, Inference Recommender expects it wrapped in a tar.gz archive.
+    # the archive is built in memory with the fastest compression level since sample payloads are tiny
+    payload = json.dumps(event).encode("utf-8")
+    payload_info = tarfile.TarInfo(name="payload.json")
+    payload_info.size = len(payload)
 
-    payload_directory = "/tmp/payload.tar.gz"
-    with tarfile.open(payload_directory, "w:gz") as tar:
-        tar.add(payload_file, arcname=os.path.basename(payload_file))
+    payload_archive = io.BytesIO()
+    with tarfile.open(fileobj=payload_archive, mode="w:gz", compresslevel=1) as tar:
+        tar.addfile(payload_info, io.BytesIO(payload))
 
-    s3_client.upload_file(payload_directory, MODEL_BUCKET, payload_directory)
+    payload_key = "payload.tar.gz"
+    s3_client.put_object(Bucket=MODEL_BUCKET, Key=payload_key, Body=payload_archive.getvalue())
 
-    sample_payload_url = f"s3://{MODEL_BUCKET}/{payload_directory}"
+    sample_payload_url = f"s3://{MODEL_BUCKET}/{payload_key}"
 
     # create a model package group if non-exist for the projectX
     model_package_group_input_dict = {
@@ -98,9 +107,7 @@ def handler(event, context):
 
     # setup timestamp to be used to trigger the custom resource update event to retrieve
     # latest approved model and to be used with model and endpoint config resources' names
-    now = datetime.now().replace(tzinfo=timezone.utc)
-
-    timestamp = now.strftime("%Y-%m-%d-%H-%M-%S")
+    timestamp = time.strftime("%Y-%m-%d-%H-%M-%S", time.gmtime())
 
     # Provide a unique job name for SageMaker Inference Recommender job
     job_name = f"{PROJECT_NAME}-{timestamp}"
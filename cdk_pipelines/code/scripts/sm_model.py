@@ -1,3 +1,4 @@
+import functools
 import boto3
 from botocore.exceptions import ClientError
 from logging import Logger
@@ -9,8 +10,10 @@ logger = Logger(name="deploy_model_stack")
 """Initialise boto3 SDK resources"""
 sm_client = boto3.client("sagemaker", region_name=DEFAULT_DEPLOYMENT_REGION)
 
+@functools.lru_cache(maxsize=1)
 def get_approved_package():
     """Gets the latest approved model package for a model package group.
+    The result is cached, so every stage synthesized in the same process shares a single registry lookup.
     Returns:
         The SageMaker Model Package ARN.
     """
@@ -15,8 +15,13 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import functools
+import hashlib
+import importlib
+from collections import OrderedDict
 from pathlib import Path
 
+import yaml
 from dataclasses import dataclass
 from aws_cdk import Stage
 import constructs
@@ -26,11 +31,14 @@ from abc import ABCMeta
 
 DEFAULT_STAGE_NAME = "dev"
 
+# libyaml based loader when PyYAML is built with it, the pure python loader otherwise
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
-def get_config_for_stage(scope: constructs, path: str):
+
+def get_config_for_stage(scope: constructs, path: str, stage_name: str = None):
 
     default_path = Path(__file__).parent.joinpath(DEFAULT_STAGE_NAME, path)
-    if stage_name := Stage.of(scope).stage_name:
+    if stage_name := stage_name or Stage.of(scope).stage_name:
         config_path = Path(__file__).parent.joinpath(stage_name.lower(), path)
 
         if not config_path.exists():
@@ -43,6 +51,50 @@ def get_config_for_stage(scope: constructs, path: str):
         return default_path
 
 
+class ParserCache:
+    """
+    LRU cache of config dataclasses keyed on the sha256 of the config file bytes, so stages sharing the same config
+    content skip parsing and schema loading entirely
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+
+    def load(self, config_class, path: Path):
+        """
+        Returns the config dataclass of the given class loaded from path, parsing the file only on a cache miss
+        """
+        data = path.read_bytes()
+        key = (config_class, hashlib.sha256(data).hexdigest())
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        config = config_class.schema().load(yaml.load(data, Loader=YAML_LOADER))
+        self._entries[key] = config
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return config
+
+
+# one entry per stage config folder is enough to hold every stage of a synth
+_PARSER_CACHE = ParserCache(maxsize=max(1, len(list(Path(__file__).parent.glob("*/constants.py")))))
+
+
+@functools.lru_cache(maxsize=None)
+def get_constants_for_stage(stage_name: str):
+    """
+    Returns the constants module of the given stage, falls back to the default stage constants if the stage has none.
+    The result is cached so stacks of the same stage do not go through the import machinery again
+    """
+    try:
+        return importlib.import_module(f"cdk_pipelines.config.{stage_name}.constants")
+    except ImportError:
+        # use default configs which are inf-dev configs in this case
+        return importlib.import_module(f"cdk_pipelines.config.{DEFAULT_STAGE_NAME}.constants")
+
+
 @dataclass
 class StageYamlDataClassConfig(YamlDataClassConfig, metaclass=ABCMeta):
     """This class implements YAML file load function with relative config paths and stage specific config loading capabilities."""
@@ -51,12 +103,12 @@ class StageYamlDataClassConfig(YamlDataClassConfig, metaclass=ABCMeta):
         """
         This method automatically uses the config from alpha
         """
-        path = Path(__file__).parent().joinpath("config/", "dev", self.FILE_PATH)
-        return super().load(path=path)
+        path = Path(__file__).parent.joinpath(DEFAULT_STAGE_NAME, self.FILE_PATH)
+        self.__dict__.update(_PARSER_CACHE.load(self.__class__, path).__dict__)
 
-    def load_for_stage(self, scope):
+    def load_for_stage(self, scope, stage_name: str = None):
         """
-        Looks up the stage from the current scope and loads the relevant config file
+        Loads the config file of the given stage, the stage is looked up from the current scope if not given
         """
-        path = get_config_for_stage(scope, self.FILE_PATH)
-        return super().load(path=path)
+        path = get_config_for_stage(scope, self.FILE_PATH, stage_name=stage_name)
+        self.__dict__.update(_PARSER_CACHE.load(self.__class__, path).__dict__)
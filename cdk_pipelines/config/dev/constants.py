@@ -19,9 +19,17 @@ VPC_ID = "vpc-0d321f7663affed2d"
 VPC_CIDR = "15.0.0.0/16"
 
 APP_SUBNETS = ["subnet-051d737bce2a09efe", "subnet-0272fcf9a6c5ad207", "subnet-0b6e3cc901590c35f"]
+APP_AZS = ["eu-west-1a", "eu-west-1b", "eu-west-1c"]
 
 BASE_SECURITY_GROUP = "sg-0657dec78ac20a372"
 
 DEFAULT_TIMEOUT = 300
 DEFAULT_MEMORY_SIZE = 256
 INFERENCE_MEMORY_SIZE = 1024
+
+# api gateway usage plan throttling, steady state requests per second and burst capacity
+API_RATE_LIMIT = 10
+API_BURST_LIMIT = 2
+
+# warm execution environments kept for the inference lambda alias, 0 disables provisioned concurrency
+PROVISIONED_CONCURRENCY = 0
@@ -19,9 +19,17 @@ VPC_ID = "vpc-"
 VPC_CIDR = "10.0.0.1/21"
 
 APP_SUBNETS = ["subnet-1", "subnet-2", "subnet-3"]
+APP_AZS = ["eu-west-1a", "eu-west-1b", "eu-west-1c"]
 
 BASE_SECURITY_GROUP = "sg-"
 
 DEFAULT_TIMEOUT = 300
 DEFAULT_MEMORY_SIZE = 256
 INFERENCE_MEMORY_SIZE = 1024
+
+# api gateway usage plan throttling, steady state requests per second and burst capacity
+API_RATE_LIMIT = 100
+API_BURST_LIMIT = 200
+
+# warm execution environments kept for the inference lambda alias, 0 disables provisioned concurrency
+PROVISIONED_CONCURRENCY = 2
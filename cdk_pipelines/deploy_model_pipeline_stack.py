@@ -55,13 +55,23 @@ class ModelStage(Stage):
 
         super().__init__(scope, id, **kwargs)
 
-        deploy_model = DeployModelStack(self, "ModelStack")
+        stage_name = self.stage_name.lower()
+
+        deploy_model = DeployModelStack(self, "ModelStack", stage_name=stage_name)
+
+        # the inference api invokes the endpoint synchronously, which sagemaker rejects for async endpoints
+        if deploy_model.async_inference:
+            raise ValueError(
+                f"Stage {stage_name} deploys an async endpoint, the inference API only supports real-time endpoints"
+            )
 
         inference_stack = InferenceStack(
             self,
             "InferenceStack",
             model_endpoint=deploy_model.endpoint,
             vpc=deploy_model.vpc,
+            base_security_group=deploy_model.base_security_group,
+            stage_name=stage_name,
         )
 
 
@@ -15,10 +15,11 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import importlib
+import functools
+import hashlib
+import os
 from aws_cdk import (
     Aws,
-    Fn,
     Stack,
     Stage,
     aws_iam as iam,
@@ -35,11 +36,60 @@ from cdk_pipelines.config.constants import (
     MODEL_PACKAGE_GROUP_NAME,
 )
 
-from datetime import datetime, timezone
 from dataclasses import dataclass
 from pathlib import Path
+from typing import Optional
 from yamldataclassconfig import create_file_path_field
-from cdk_pipelines.config.config_mux import StageYamlDataClassConfig
+from cdk_pipelines.config.config_mux import StageYamlDataClassConfig, get_constants_for_stage
+
+# resource ARNs used by the model execution policy, Aws.REGION is a stack agnostic token resolved at deploy time
+S3_BUCKET_ARN = f"arn:aws:s3:::{APP_PREFIX}*"
+KMS_KEY_ARN = f"arn:aws:kms:{Aws.REGION}:{DEV_ACCOUNT}:key/*"
+ECR_REPOSITORY_ARN = f"arn:aws:ecr:{Aws.REGION}:{DEV_ACCOUNT}:repository/{APP_PREFIX}*"
+
+
+@functools.lru_cache(maxsize=None)
+def build_model_execution_statements():
+    """
+    Builds the statements of the model execution policy. They only depend on constants and stack agnostic tokens,
+    so they are built once and shared by the model stacks of every stage
+
+    Returns:
+        tuple of iam.PolicyStatement
+    """
+    return (
+        iam.PolicyStatement(
+            actions=["s3:GetObject", "s3:PutObject", "s3:ListBucket"],
+            effect=iam.Effect.ALLOW,
+            resources=[S3_BUCKET_ARN],
+        ),
+        iam.PolicyStatement(
+            actions=[
+                "kms:Encrypt",
+                "kms:ReEncrypt*",
+                "kms:GenerateDataKey*",
+                "kms:Decrypt",
+                "kms:DescribeKey",
+            ],
+            effect=iam.Effect.ALLOW,
+            resources=[KMS_KEY_ARN],
+        ),
+        iam.PolicyStatement(
+            actions=[
+                "ecr:BatchCheckLayerAvailability",
+                "ecr:GetDownloadUrlForLayer",
+                "ecr:BatchGetImage",
+            ],
+            effect=iam.Effect.ALLOW,
+            resources=[ECR_REPOSITORY_ARN],
+        ),
+        # authorization tokens are not scoped to a repository
+        iam.PolicyStatement(
+            actions=["ecr:GetAuthorizationToken"],
+            effect=iam.Effect.ALLOW,
+            resources=["*"],
+        ),
+    )
 
 
 @dataclass
@@ -53,6 +103,13 @@ class EndpointConfigProductionVariant(StageYamlDataClassConfig):
     initial_variant_weight: float = 1
     instance_type: str = "ml.m5.2xlarge"
     variant_name: str = "AllTraffic"
+    # micro-batching of the inference container, requests arriving within the delay are scored together
+    max_batch_size: int = 32
+    max_batch_delay_ms: float = 2
+    container_startup_health_check_timeout_in_seconds: Optional[int] = None
+    # asynchronous inference, results are written to the s3 output path instead of being returned to the caller
+    async_inference: bool = False
+    async_output_s3: Optional[str] = None
 
     FILE_PATH: Path = create_file_path_field("endpoint-config.yml", path_is_absolute=True)
 
@@ -73,10 +130,44 @@ class EndpointConfigProductionVariant(StageYamlDataClassConfig):
             instance_type=self.instance_type,
             variant_name=self.variant_name,
             model_name=model_name,
+            container_startup_health_check_timeout_in_seconds=self.container_startup_health_check_timeout_in_seconds,
         )
 
         return production_variant
 
+    def get_async_inference_config(self):
+        """
+        Function to build the async inference config of the endpoint config when async inference is enabled.
+
+        Returns:
+            AsyncInferenceConfigProperty: CDK SageMaker async inference config, None for real-time endpoints
+        """
+
+        if not self.async_inference:
+            return None
+
+        if not self.async_output_s3:
+            raise ValueError("async_output_s3 must be set when async_inference is enabled")
+
+        return sagemaker.CfnEndpointConfig.AsyncInferenceConfigProperty(
+            output_config=sagemaker.CfnEndpointConfig.AsyncInferenceOutputConfigProperty(
+                s3_output_path=self.async_output_s3
+            )
+        )
+
+    def get_container_environment(self):
+        """
+        Function to build the environment of the inference container from the batching configs.
+
+        Returns:
+            dict: environment variables read by the model server
+        """
+
+        return {
+            "MAX_BATCH": str(self.max_batch_size),
+            "BATCH_DELAY_MS": f"{self.max_batch_delay_ms:g}",
+        }
+
 
 class DeployModelStack(Stack):
     """
@@ -88,55 +179,30 @@ class DeployModelStack(Stack):
         self,
         scope: constructs,
         id: str,
+        shared_model_policy: iam.IManagedPolicy = None,
+        vpc: ec2.IVpc = None,
+        base_security_group: ec2.ISecurityGroup = None,
+        stage_name: str = None,
         **kwargs,
     ):
 
         super().__init__(scope, id, **kwargs)
 
-        stage_name = Stage.of(self).stage_name.lower()
+        # stage name is looked up from the construct tree only when the parent stage did not pass it
+        if stage_name is None:
+            stage_name = Stage.of(self).stage_name.lower()
 
         # load constants required for each stage
-        try:
-            stage_constants = importlib.import_module(f"cdk_pipelines.config.{stage_name}.constants")
-        except Exception:
-            stage_constants = importlib.import_module(
-                "cdk_pipelines.config.dev.constants"
-            )  # use default configs which are inf-dev configs in this case
-
-        # iam role that would be used by the model endpoint to run the inference
-        model_execution_policy = iam.ManagedPolicy(
-            self,
-            "ModelExecutionPolicy",
-            document=iam.PolicyDocument(
-                statements=[
-                    iam.PolicyStatement(
-                        actions=["s3:*"],
-                        effect=iam.Effect.ALLOW,
-                        resources=[
-                            f"arn:aws:s3:::{APP_PREFIX}*",
-                        ],
-                    ),
-                    iam.PolicyStatement(
-                        actions=[
-                            "kms:Encrypt",
-                            "kms:ReEncrypt*",
-                            "kms:GenerateDataKey*",
-                            "kms:Decrypt",
-                            "kms:DescribeKey",
-                        ],
-                        effect=iam.Effect.ALLOW,
-                        resources=[f"arn:aws:kms:{Aws.REGION}:{DEV_ACCOUNT}:key/*"],
-                    ),
-                    iam.PolicyStatement(
-                        actions=["ecr:*"],
-                        effect=iam.Effect.ALLOW,
-                        resources=[
-                            f"arn:aws:ecr:{Aws.REGION}:{DEV_ACCOUNT}:repository/{APP_PREFIX}*",
-                        ],
-                    ),
-                ]
-            ),
-        )
+        stage_constants = get_constants_for_stage(stage_name)
+
+        # iam policy that would be used by the model endpoint to run the inference, unless an existing one is shared
+        model_execution_policy = shared_model_policy
+        if model_execution_policy is None:
+            model_execution_policy = iam.ManagedPolicy(
+                self,
+                "ModelExecutionPolicy",
+                document=iam.PolicyDocument(statements=list(build_model_execution_statements())),
+            )
 
         model_execution_role = iam.Role(
             self,
@@ -148,31 +214,43 @@ class DeployModelStack(Stack):
             ],
         )
 
-        # setup timestamp to be used to trigger the custom resource update event to retrieve latest approved model and to be used with model and endpoint config resources' names
-        now = datetime.now().replace(tzinfo=timezone.utc)
-
-        timestamp = now.strftime("%Y-%m-%d-%H-%M-%S")
-
         # get latest approved model package from the model registry (only from a specific model package group)
         latest_approved_model_package = get_approved_package()
         # latest_approved_model_package ="1"
 
-        # vpc resource to be used for the endpoint and lambda vpc configs
-        self.vpc = ec2.Vpc.from_vpc_attributes(
-            self, "VPC", vpc_id=stage_constants.VPC_ID, availability_zones=Fn.get_azs()
-        )
+        endpoint_config_production_variant = EndpointConfigProductionVariant()
 
-        # subnets resources should use
-        subnets = [
-            ec2.Subnet.from_subnet_id(self, f"SUBNET-{subnet_id}", subnet_id)
-            for subnet_id in stage_constants.APP_SUBNETS
-        ]
+        endpoint_config_production_variant.load_for_stage(self, stage_name=stage_name)
+
+        # vpc resource to be used for the endpoint and lambda vpc configs
+        self.vpc = vpc
+        if self.vpc is None:
+            self.vpc = ec2.Vpc.from_vpc_attributes(
+                self, "VPC", vpc_id=stage_constants.VPC_ID, availability_zones=list(stage_constants.APP_AZS)
+            )
 
         # security group for the model endpoint
         # account base security group
-        base_security_group = ec2.SecurityGroup.from_security_group_id(
-            self, "BaseSG", security_group_id=stage_constants.BASE_SECURITY_GROUP
-        )
+        self.base_security_group = base_security_group
+        if self.base_security_group is None:
+            self.base_security_group = ec2.SecurityGroup.from_security_group_id(
+                self, "BaseSG", security_group_id=stage_constants.BASE_SECURITY_GROUP
+            )
+
+        # values of the model resource, any change to them requires a replacement and thus a new name
+        model_subnets = list(stage_constants.APP_SUBNETS)
+        model_environment = endpoint_config_production_variant.get_container_environment()
+
+        # setup timestamp to be used with model and endpoint config resources' names, a new value replaces both resources.
+        # the pipeline can pin it through the model_timestamp context value or the MODEL_TIMESTAMP environment variable,
+        # otherwise it is derived from the model and endpoint config inputs so unchanged synths produce identical templates
+        timestamp = self.node.try_get_context("model_timestamp") or os.environ.get("MODEL_TIMESTAMP")
+        if not timestamp:
+            model_inputs = (
+                f"{latest_approved_model_package}|{model_subnets}|{self.base_security_group.security_group_id}|"
+                f"{sorted(model_environment.items())}|{endpoint_config_production_variant}"
+            )
+            timestamp = hashlib.sha256(model_inputs.encode("utf-8")).hexdigest()[:12]
 
         # Sagemaker Model
         model_name = f"{MODEL_PACKAGE_GROUP_NAME}-{stage_name}-{timestamp}"
@@ -183,21 +261,20 @@ class DeployModelStack(Stack):
             execution_role_arn=model_execution_role.role_arn,
             model_name=model_name,
             containers=[
-                sagemaker.CfnModel.ContainerDefinitionProperty(model_package_name=latest_approved_model_package)
+                sagemaker.CfnModel.ContainerDefinitionProperty(
+                    model_package_name=latest_approved_model_package,
+                    environment=model_environment,
+                )
             ],
             vpc_config=sagemaker.CfnModel.VpcConfigProperty(
-                security_group_ids=[base_security_group.security_group_id],
-                subnets=[subnet.subnet_id for subnet in subnets],
+                security_group_ids=[self.base_security_group.security_group_id],
+                subnets=model_subnets,
             ),
         )
 
         # Sagemaker Endpoint Config
         endpoint_config_name = f"{MODEL_PACKAGE_GROUP_NAME}-{stage_name}-endpointConfig-{timestamp}"
 
-        endpoint_config_production_variant = EndpointConfigProductionVariant()
-
-        endpoint_config_production_variant.load_for_stage(self)
-
         endpoint_config = sagemaker.CfnEndpointConfig(
             self,
             "EndpointConfig",
@@ -205,6 +282,7 @@ class DeployModelStack(Stack):
             production_variants=[
                 endpoint_config_production_variant.get_endpoint_config_production_variant(model.model_name)
             ],
+            async_inference_config=endpoint_config_production_variant.get_async_inference_config(),
         )
 
         endpoint_config.add_depends_on(model)
@@ -222,3 +300,4 @@ class DeployModelStack(Stack):
         endpoint.add_depends_on(endpoint_config)
 
         self.endpoint = endpoint
+        self.async_inference = endpoint_config_production_variant.async_inference
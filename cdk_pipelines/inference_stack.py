@@ -15,9 +15,19 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import functools
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import jsii
 from aws_cdk import (
+    AssetHashType,
     Aws,
+    BundlingOptions,
     Duration,
+    ILocalBundling,
     Stack,
     Stage,
     aws_ec2 as ec2,
@@ -28,15 +38,114 @@ from aws_cdk import (
     aws_kms as kms,
 )
 
-from aws_cdk.aws_lambda_python_alpha import PythonFunction, PythonLayerVersion
 import constructs
 from cdk_pipelines.config.constants import (
     APP_PREFIX,
     LAMBDA_FUNCTION_ENTRY,
     MODEL_PACKAGE_GROUP_NAME,
 )
+from cdk_pipelines.config.config_mux import get_constants_for_stage
+
+# resource ARNs used by the inference function policy, the Aws tokens are stack agnostic and resolved at deploy time
+LOG_GROUP_ARN = f"arn:aws:logs:*:{Aws.ACCOUNT_ID}:log-group:*"
+LOG_STREAM_ARN = f"arn:aws:logs:*:{Aws.ACCOUNT_ID}:log-group:*:log-stream:*"
+ENDPOINT_ARN = f"arn:aws:sagemaker:{Aws.REGION}:{Aws.ACCOUNT_ID}:endpoint/{MODEL_PACKAGE_GROUP_NAME}*"
+
+# runtime of the inference lambda, the layer is bundled for the same python version
+LAMBDA_RUNTIME = lambda_.Runtime.PYTHON_3_11
 
-import importlib
+
+@jsii.implements(ILocalBundling)
+class LocalPipBundling:
+    """
+    Local Pip Bundling
+    Installs the requirements of a lambda layer with the local pip instead of starting the docker bundling image.
+    Only manylinux or pure python wheels are accepted, when they cannot be resolved CDK falls back to docker bundling.
+    """
+
+    def __init__(self, entry: str, runtime: lambda_.Runtime):
+        self.entry = entry
+        self.python_version = runtime.name.replace("python", "")
+
+    def try_bundle(self, output_dir, options):
+        target = Path(output_dir, "python")
+        try:
+            subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "pip",
+                    "install",
+                    "--quiet",
+                    "-r",
+                    str(Path(self.entry, "requirements.txt")),
+                    "-t",
+                    str(target),
+                    "--platform",
+                    "manylinux2014_x86_64",
+                    "--implementation",
+                    "cp",
+                    "--python-version",
+                    self.python_version,
+                    "--only-binary=:all:",
+                ],
+                check=True,
+            )
+        except (OSError, subprocess.CalledProcessError):
+            shutil.rmtree(target, ignore_errors=True)
+            return False
+
+        shutil.copytree(self.entry, target, dirs_exist_ok=True)
+        return True
+
+
+@functools.lru_cache(maxsize=None)
+def build_inference_function_statements():
+    """
+    Builds the statements added to the inference lambda role, built once and shared by the stacks of every stage
+    """
+    return (
+        iam.PolicyStatement(
+            actions=["logs:CreateLogGroup", "logs:CreateLogStream", "logs:PutLogEvents"],
+            effect=iam.Effect.ALLOW,
+            resources=[
+                LOG_GROUP_ARN,
+                LOG_STREAM_ARN,
+            ],
+        ),
+        iam.PolicyStatement(
+            actions=["sagemaker:InvokeEndpoint"],
+            effect=iam.Effect.ALLOW,
+            resources=[ENDPOINT_ARN],
+        ),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def build_log_key_statements():
+    """
+    Builds the key policy statements of the api gateway logs kms key, built once and shared by the stacks of every stage
+    """
+    return (
+        iam.PolicyStatement(
+            actions=["kms:*"],
+            effect=iam.Effect.ALLOW,
+            resources=["*"],
+            principals=[iam.AccountRootPrincipal()],
+        ),
+        iam.PolicyStatement(
+            actions=[
+                "kms:Encrypt*",
+                "kms:Decrypt*",
+                "kms:ReEncrypt*",
+                "kms:GenerateDataKey*",
+                "kms:Describe*",
+            ],
+            effect=iam.Effect.ALLOW,
+            resources=["*"],
+            principals=[iam.ServicePrincipal(f"logs.{Aws.REGION}.amazonaws.com")],
+        ),
+    )
 
 
 class InferenceStack(Stack):
@@ -51,48 +160,62 @@ class InferenceStack(Stack):
         id: str,
         model_endpoint,
         vpc,
+        base_security_group: ec2.ISecurityGroup = None,
+        stage_name: str = None,
         **kwargs,
     ):
 
         super().__init__(scope, id, **kwargs)
 
-        stage_name = Stage.of(self).stage_name.lower()
+        # stage name is looked up from the construct tree only when the parent stage did not pass it
+        if stage_name is None:
+            stage_name = Stage.of(self).stage_name.lower()
 
         # load constants required for each stage
-        try:
-            stage_constants = importlib.import_module(f"cdk_pipelines.config.{stage_name}.constants")
-        except Exception:
-            stage_constants = importlib.import_module(
-                "cdk_pipelines.config.dev.constants"
-            )  # use default configs which are inf-dev configs in this case
+        stage_constants = get_constants_for_stage(stage_name)
 
         # create lambda layer for aws powertools package
-        aws_lambda_powertools_lambda_layer = PythonLayerVersion(
+        # bundled with the local pip when possible, the asset hash only depends on the layer sources so unchanged
+        # requirements reuse the previous bundle instead of being installed again
+        aws_lambda_powertools_layer_entry = f"{LAMBDA_FUNCTION_ENTRY}/layers/aws_lambda_powertools"
+        aws_lambda_powertools_lambda_layer = lambda_.LayerVersion(
             self,
             "AWSLambdaPowerTools",
-            entry=f"{LAMBDA_FUNCTION_ENTRY}/layers/aws_lambda_powertools",
-            compatible_runtimes=[
-                lambda_.Runtime.PYTHON_3_7,
-                lambda_.Runtime.PYTHON_3_8,
-            ],
+            code=lambda_.Code.from_asset(
+                aws_lambda_powertools_layer_entry,
+                asset_hash_type=AssetHashType.SOURCE,
+                bundling=BundlingOptions(
+                    image=LAMBDA_RUNTIME.bundling_image,
+                    command=[
+                        "bash",
+                        "-c",
+                        "pip install -r requirements.txt -t /asset-output/python && cp -au . /asset-output/python",
+                    ],
+                    local=LocalPipBundling(aws_lambda_powertools_layer_entry, LAMBDA_RUNTIME),
+                ),
+            ),
+            compatible_runtimes=[LAMBDA_RUNTIME],
         )
 
         # subnets resources should use
-        subnets = [
+        self.subnets = [
             ec2.Subnet.from_subnet_id(self, f"SUBNET-{subnet_id}", subnet_id)
             for subnet_id in stage_constants.APP_SUBNETS
         ]
 
-        # account base security group
-        base_security_group = ec2.SecurityGroup.from_security_group_id(
-            self, "BaseSG", security_group_id=stage_constants.BASE_SECURITY_GROUP
-        )
+        # account base security group, looked up here only if it is not shared by another stack of the stage
+        if base_security_group is None:
+            base_security_group = ec2.SecurityGroup.from_security_group_id(
+                self, "BaseSG", security_group_id=stage_constants.BASE_SECURITY_GROUP
+            )
 
         # lambda function for running inference for delivery risk ml models
-        inference_api_lambda_function = PythonFunction(
+        # the handler only depends on boto3 and the powertools layer, so the sources are zipped as they are
+        inference_api_lambda_function = lambda_.Function(
             self,
             "APIFunction",
-            entry=f"{LAMBDA_FUNCTION_ENTRY}/inference/api",
+            code=lambda_.Code.from_asset(f"{LAMBDA_FUNCTION_ENTRY}/inference/api", exclude=["__pycache__", "*.pyc"]),
+            handler="index.handler",
             description="run inference endpoint for delivery risk data",
             environment={
                 "POWERTOOLS_LOGGER_SAMPLE_RATE": "1",
@@ -101,13 +224,13 @@ class InferenceStack(Stack):
             layers=[
                 aws_lambda_powertools_lambda_layer,
             ],
-            runtime=lambda_.Runtime.PYTHON_3_7,
+            runtime=LAMBDA_RUNTIME,
             function_name=f"{APP_PREFIX}-{stage_name}-inference-api",
             timeout=Duration.seconds(stage_constants.DEFAULT_TIMEOUT),
             memory_size=stage_constants.INFERENCE_MEMORY_SIZE,
             vpc=vpc,
             security_groups=[base_security_group],
-            vpc_subnets=ec2.SubnetSelection(subnets=subnets),
+            vpc_subnets=ec2.SubnetSelection(subnets=self.subnets),
             reserved_concurrent_executions=100,
         )
 
@@ -115,23 +238,13 @@ class InferenceStack(Stack):
             iam.ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaVPCAccessExecutionRole")
         )
 
-        inference_api_lambda_function.role.add_to_policy(
-            iam.PolicyStatement(
-                actions=["logs:CreateLogGroup", "logs:CreateLogStream", "logs:PutLogEvents"],
-                effect=iam.Effect.ALLOW,
-                resources=[
-                    f"arn:aws:logs:*:{Aws.ACCOUNT_ID}:log-group:*",
-                    f"arn:aws:logs:*:{Aws.ACCOUNT_ID}:log-group:*:log-stream:*",
-                ],
-            )
-        )
+        for statement in build_inference_function_statements():
+            inference_api_lambda_function.role.add_to_policy(statement)
 
-        inference_api_lambda_function.role.add_to_policy(
-            iam.PolicyStatement(
-                actions=["sagemaker:InvokeEndpoint"],
-                effect=iam.Effect.ALLOW,
-                resources=[f"arn:aws:sagemaker:{Aws.REGION}:{Aws.ACCOUNT_ID}:endpoint/{MODEL_PACKAGE_GROUP_NAME}*"],
-            )
+        # api gateway invokes the published version through an alias, which holds the warm environments if any
+        inference_api_lambda_alias = inference_api_lambda_function.add_alias(
+            "live",
+            provisioned_concurrent_executions=stage_constants.PROVISIONED_CONCURRENCY or None,
         )
 
         # api gateway log group setup for inference
@@ -140,22 +253,7 @@ class InferenceStack(Stack):
             "KMSKey",
             enable_key_rotation=True,
             description="key used for encryption of data for api gateway logs",
-            policy=iam.PolicyDocument(
-                statements=[
-                    iam.PolicyStatement(
-                        actions=["kms:*"],
-                        effect=iam.Effect.ALLOW,
-                        resources=["*"],
-                        principals=[iam.AccountRootPrincipal()],
-                    ),
-                    iam.PolicyStatement(
-                        actions=["kms:*"],
-                        effect=iam.Effect.ALLOW,
-                        resources=["*"],
-                        principals=[iam.ServicePrincipal(f"logs.{Aws.REGION}.amazonaws.com")],
-                    ),
-                ]
-            ),
+            policy=iam.PolicyDocument(statements=list(build_log_key_statements())),
         )
 
         prd_log_group = logs.LogGroup(self, "PrdLogs", encryption_key=kms_key)
@@ -164,7 +262,7 @@ class InferenceStack(Stack):
         api = api_gateway.LambdaRestApi(
             self,
             "InferenceAPI",
-            handler=inference_api_lambda_function,
+            handler=inference_api_lambda_alias,
             proxy=False,
             deploy_options=api_gateway.StageOptions(
                 access_log_destination=api_gateway.LogGroupLogDestination(prd_log_group),
@@ -177,7 +275,11 @@ class InferenceStack(Stack):
         )
 
         plan = api.add_usage_plan(
-            "UsagePlan", name="Easy", throttle=api_gateway.ThrottleSettings(rate_limit=10, burst_limit=2)
+            "UsagePlan",
+            name="Easy",
+            throttle=api_gateway.ThrottleSettings(
+                rate_limit=stage_constants.API_RATE_LIMIT, burst_limit=stage_constants.API_BURST_LIMIT
+            ),
         )
 
         plan.add_api_stage(